@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+#
+# Command line tool to convert simple ESP-IDF Makefile & component.mk files to
+# CMakeLists.txt files
+#
+# Copyright 2018 Espressif Systems (Shanghai) PTE LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import argparse
+import functools
+import subprocess
+import re
+import os.path
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+debug = False
+
+# keeps interleaved log lines from worker threads intact
+_print_lock = threading.Lock()
+
+# Widen the kernel pipe buffer where supported, so 'make -rpn' isn't
+# stalled every 64KB while dumping its (potentially multi-MB) database
+_SUBPROCESS_PIPE_ARGS = {"bufsize": 1 << 16}
+if sys.version_info >= (3, 10):
+    _SUBPROCESS_PIPE_ARGS["pipesize"] = 1 << 20
+
+# Variables read back out of component_wrapper.mk for each component
+COMPONENT_MAKE_VARS = (
+    "COMPONENT_OBJS",
+    "COMPONENT_SRCS",
+    "COMPONENT_SRCDIRS",
+    "COMPONENT_ADD_INCLUDEDIRS",
+    "CFLAGS",
+)
+
+# All component_wrapper.mk state to clear between the driver makefile's
+# repeated includes. Beyond the tracked variables this covers conditionals a
+# component.mk may set: COMPONENT_CONFIG_ONLY (set by e.g. the bootloader
+# component) would otherwise disable the wrapper's COMPONENT_OBJS defaulting
+# for every component included after it, and the OBJEXCLUDE/OBJINCLUDE lists
+# would keep filtering later components' objects. An empty ':=' is enough -
+# make's ifdef/ifndef treat an empty value as undefined.
+_COMPONENT_RESET_VARS = COMPONENT_MAKE_VARS + (
+    "COMPONENT_CONFIG_ONLY",
+    "COMPONENT_OBJEXCLUDE",
+    "COMPONENT_OBJINCLUDE",
+)
+
+# 'make -rpn' prints a "# makefile" comment immediately before each variable
+# which was set in a makefile (as opposed to built-in or environment
+# variables); this matches such a comment plus the assignment line after it,
+# over the raw undecoded dump
+_MAKEFILE_PAIR_RE = re.compile(rb"^# makefile[^\n]*\n([^ \n]+) :?= ([^\n]+)", re.MULTILINE)
+
+# variables make itself sets in every makefile, never interesting to us
+_BUILT_IN_VARS = frozenset(("MAKEFILE_LIST", "SHELL", "CURDIR", "MAKEFLAGS"))
+
+
+def get_make_variables(path, makefile="Makefile", expected_failure=False, variables=None):
+    """
+    Given the path to a Makefile of some kind, return a dictionary of all variables defined in this Makefile
+
+    Uses 'make' to parse the Makefile syntax, so we don't have to!
+
+    Results are cached per (path, makefile, variables) so repeated queries for
+    the same component don't spawn 'make' again.
+
+    Overrides IDF_PATH= to avoid recursively evaluating the entire project Makefile structure.
+    """
+    if variables is None:
+        variables = {}
+    variable_setters = tuple(sorted("%s=%s" % (k, v) for (k, v) in variables.items()))
+    # return a copy, callers modify the result
+    return dict(_get_make_variables_cached(path, makefile, expected_failure, variable_setters))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_make_variables_cached(path, makefile, expected_failure, variable_setters):
+    cmdline = ["make", "-rpn", "-C", path, "-f", makefile] + list(variable_setters)
+    if debug:
+        print("Running %s..." % (" ".join(cmdline)))
+
+    p = subprocess.Popen(cmdline,
+                         stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE if debug else subprocess.DEVNULL,
+                         **_SUBPROCESS_PIPE_ARGS)
+    (output, stderr_output) = p.communicate(b"\n")
+    if debug and stderr_output:
+        print("Make stderr:\n%s" % stderr_output.decode())
+
+    result = {}
+    # one C-level regex pass over the raw bytes extracts every
+    # comment/assignment pair; only the matched names and values are
+    # ever decoded, never the multi-MB dump itself
+    for m in _MAKEFILE_PAIR_RE.finditer(output):
+        var = m.group(1).decode()
+        if var not in _BUILT_IN_VARS:
+            result[var] = m.group(2).decode().strip()
+
+    if (not expected_failure) and p.returncode != 0:
+        print("Make failed to run, result %d. Re-run with --debug for make's stderr." % p.returncode)
+        raise SystemExit(1)
+
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _dir_entries(path):
+    """Set of filenames in a directory, or None if it can't be scanned"""
+    try:
+        return frozenset(entry.name for entry in os.scandir(path))
+    except OSError:
+        return None
+
+
+def get_components_variables(project_path, component_paths):
+    """
+    Evaluate component.mk for every component with a single 'make' invocation.
+
+    Generates a temporary driver makefile which includes component_wrapper.mk
+    once per component and dumps each tracked variable with $(info), then
+    splits the combined output on the COMPONENT= sentinel lines.
+
+    Returns a dict of {component_path: make variables dict}.
+    """
+    lines = ["all: ;", ""]
+    for component_path in component_paths:
+        # clear wrapper state so values can't leak from the previous component
+        lines += ["%s :=" % var for var in _COMPONENT_RESET_VARS]
+        lines += ["COMPONENT_MAKEFILE := %s" % os.path.join(component_path, "component.mk"),
+                  "COMPONENT_NAME := %s" % os.path.basename(component_path),
+                  "PROJECT_PATH := %s" % project_path,
+                  "include $(IDF_PATH)/make/component_wrapper.mk",
+                  "$(info COMPONENT=%s)" % component_path]
+        lines += ["$(info %s=$(%s))" % (var, var) for var in COMPONENT_MAKE_VARS]
+        lines.append("")
+
+    result = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        driver_makefile = os.path.join(tmpdir, "Makefile")
+        with open(driver_makefile, "w") as f:
+            f.write("\n".join(lines))
+
+        cmdline = ["make", "-rns", "-C", tmpdir, "-f", driver_makefile]
+        if debug:
+            print("Running %s..." % (" ".join(cmdline)))
+        # don't make the child pipe (and us buffer) stderr we never read
+        p = subprocess.run(cmdline,
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE if debug else subprocess.DEVNULL,
+                           **_SUBPROCESS_PIPE_ARGS)
+        if debug and p.stderr:
+            print("Make stderr:\n%s" % p.stderr.decode())
+
+        make_vars = None
+        for line in p.stdout.decode().split("\n"):
+            if line.startswith("COMPONENT="):
+                make_vars = result.setdefault(line[len("COMPONENT="):], {})
+            elif make_vars is not None and "=" in line:
+                (var, val) = line.split("=", 1)
+                # skip empty values, so '"COMPONENT_OBJS" in make_vars' still
+                # distinguishes variables the component didn't set at all
+                if var in COMPONENT_MAKE_VARS and val.strip() != "":
+                    make_vars[var] = val.strip()
+
+    return result
+
+
+def get_component_variables(project_path, component_path, make_vars=None):
+    # bound as locals, the loops below hit these often enough that the
+    # repeated os.path attribute lookups show up
+    _join = os.path.join
+    _norm = os.path.normpath
+    _rel = os.path.relpath
+
+    if make_vars is None:  # not pre-evaluated by get_components_variables
+        make_vars = get_make_variables(component_path,
+                                       os.path.join(os.environ["IDF_PATH"],
+                                                    "make",
+                                                    "component_wrapper.mk"),
+                                       expected_failure=True,
+                                       variables={
+                                           "COMPONENT_MAKEFILE": os.path.join(component_path, "component.mk"),
+                                           "COMPONENT_NAME": os.path.basename(component_path),
+                                           "PROJECT_PATH": project_path,
+                                       })
+
+    if "COMPONENT_OBJS" in make_vars:  # component.mk specifies list of object files
+        # Convert to corresponding list of source files
+        def find_src(obj):
+            obj = os.path.splitext(obj)[0]
+            (dirname, base) = os.path.split(obj)
+            entries = _dir_entries(_norm(_join(component_path, dirname)))
+            if entries is not None:
+                # one scandir per directory instead of one stat per extension
+                for ext in ["c", "cpp", "S"]:
+                    if base + "." + ext in entries:
+                        return obj + "." + ext
+            else:  # directory vanished or unreadable, fall back to probing
+                for ext in ["c", "cpp", "S"]:
+                    if os.path.exists(_join(component_path, obj) + "." + ext):
+                        return obj + "." + ext
+            with _print_lock:
+                print("WARNING: Can't find source file for component %s COMPONENT_OBJS %s" % (component_path, obj))
+            return None
+
+        srcs = []
+        for obj in make_vars["COMPONENT_OBJS"].split():
+            src = find_src(obj)
+            if src is not None:
+                srcs.append(src)
+        make_vars["COMPONENT_SRCS"] = " ".join(srcs)
+    else:
+        component_srcs = list()
+        for component_srcdir in make_vars.get("COMPONENT_SRCDIRS", ".").split():
+            component_srcdir_path = os.path.abspath(_join(component_path, component_srcdir))
+
+            # single directory scan instead of one glob per extension
+            try:
+                with os.scandir(component_srcdir_path) as it:
+                    for entry in it:
+                        name = entry.name
+                        if not name.startswith(".") and name.endswith((".c", ".S", ".cpp")):
+                            component_srcs.append(_rel(_join(component_srcdir_path, name), component_path))
+            except OSError:  # nonexistent srcdir, same result as glob finding nothing
+                pass
+        make_vars["COMPONENT_SRCS"] = " ".join(component_srcs)
+
+    return make_vars
+
+
+def convert_project(project_path):
+    # localize the os.path helpers used repeatedly below
+    _join = os.path.join
+    _norm = os.path.normpath
+    _rel = os.path.relpath
+    _base = os.path.basename
+
+    if not os.path.exists(project_path):
+        raise RuntimeError("Project directory '%s' not found" % project_path)
+    if not os.path.exists(_join(project_path, "Makefile")):
+        raise RuntimeError("Directory '%s' doesn't contain a project Makefile" % project_path)
+
+    project_vars = get_make_variables(project_path, expected_failure=True)
+    if "PROJECT_NAME" not in project_vars:
+        raise RuntimeError("PROJECT_NAME does not appear to be defined in IDF project Makefile at %s" % project_path)
+
+    component_paths = project_vars["COMPONENT_PATHS"].split()
+
+    # "main" component is special in cmake, so extract it from the
+    # component_paths list (single pass, basename evaluated once per entry)
+    main_component_path = None
+    non_main_paths = []
+    for p in component_paths:
+        if _base(p) == "main":
+            main_component_path = p
+        else:
+            non_main_paths.append(p)
+    if main_component_path is None:
+        raise RuntimeError("Project at %s has no 'main' component" % project_path)
+    component_paths = non_main_paths
+
+    # Drop components which already have a CMakeLists.txt before evaluating
+    # anything, so the batched make pass below doesn't pay for them
+    # (common on incremental re-runs of the converter)
+    unconverted_paths = []
+    for p in component_paths:
+        if os.path.exists(_join(p, "CMakeLists.txt")):
+            print("Skipping already-converted component %s..." % p)
+        else:
+            unconverted_paths.append(p)
+    component_paths = unconverted_paths
+
+    # Evaluate every component.mk with a single 'make' pass
+    # (main is always included, its sources feed MAIN_SRCS below)
+    components_vars = get_components_variables(project_path, component_paths + [main_component_path])
+
+    # Convert components as needed. Each conversion reads and writes disjoint
+    # files and spends its time in syscalls (the GIL is released there), so
+    # threads give near-linear speedup on multi-core hosts
+    with ThreadPoolExecutor(max_workers=min(32, os.cpu_count() or 4)) as executor:
+        # list() propagates any exception raised in a worker
+        list(executor.map(lambda p: convert_component(project_path, p, components_vars.get(p)),
+                          component_paths))
+
+    # Look up project variables before writing the file, so nothing is
+    # created if the main component fails to convert
+    main_vars = get_component_variables(project_path, main_component_path,
+                                        components_vars.get(main_component_path))
+    main_srcs = [_rel(_norm(_join(main_component_path, m)), project_path)
+                 for m in main_vars["COMPONENT_SRCS"].split()]
+
+    project_name = project_vars["PROJECT_NAME"]
+    project_cmakelists = _join(project_path, "CMakeLists.txt")
+    if os.path.exists(project_cmakelists):
+        print("Skipping existing project CMakeLists.txt file %s..." % project_cmakelists)
+        return
+
+    # resolve all substitutions into one string and emit it with a single write
+    main_srcs_joined = " ".join(main_srcs)
+    content = """
+# (Automatically converted from project Makefile by convert_to_cmake.py.)
+
+# The following four lines of boilerplate have to be in your project's CMakeLists
+# in this exact order for cmake to work correctly
+cmake_minimum_required(VERSION 3.5)
+set(PROJECT_NAME %s)
+set(MAIN_SRCS %s)
+
+include($ENV{IDF_PATH}/tools/cmake/project.cmake)
+""" % (project_name, main_srcs_joined)
+    with open(project_cmakelists, "w", buffering=1 << 16) as f:
+        f.write(content)
+
+    print("Converted project %s" % project_cmakelists)
+
+
+def convert_component(project_path, component_path, make_vars=None):
+    _join = os.path.join
+    _norm = os.path.normpath
+
+    if debug:
+        with _print_lock:
+            print("Converting %s..." % (component_path))
+    cmakelists_path = _join(component_path, "CMakeLists.txt")
+    if os.path.exists(cmakelists_path):
+        with _print_lock:
+            print("Skipping already-converted component %s..." % component_path)
+        return
+    v = get_component_variables(project_path, component_path, make_vars)
+
+    # Look up all the variables before opening the file, so the file doesn't
+    # get created if an error occurs
+    component_srcs = v.get("COMPONENT_SRCS", None)
+
+    # If COMPONENT_SRCS is exactly the list of source files in the component
+    # directory (the default), emit COMPONENT_SRCDIRS instead - friendlier
+    # when new source files are added later
+    component_srcdirs = None
+    if component_srcs is not None:
+        component_allsrcs = set()
+        with os.scandir(component_path) as it:
+            for entry in it:
+                name = entry.name
+                if not name.startswith(".") and name.endswith((".c", ".S", ".cpp")):
+                    component_allsrcs.add(_join(component_path, name))
+
+        # cheap length check first - only normalize COMPONENT_SRCS into a
+        # second set when the counts could still match
+        src_list = component_srcs.split()
+        if len(src_list) == len(component_allsrcs):
+            abs_component_srcs = {_norm(_join(component_path, p)) for p in src_list}
+            if component_allsrcs == abs_component_srcs:
+                component_srcdirs = v.get("COMPONENT_SRCDIRS")
+
+    component_add_includedirs = v.get("COMPONENT_ADD_INCLUDEDIRS", None)
+    cflags = v.get("CFLAGS", None)
+
+    if component_srcdirs is not None:
+        sources_line = "set(COMPONENT_SRCDIRS \"%s\")" % component_srcdirs
+    else:
+        sources_line = "set(COMPONENT_SRCS \"%s\")" % component_srcs
+
+    lines = ["set(COMPONENT_ADD_INCLUDEDIRS %s)" % component_add_includedirs,
+             "",
+             "# Edit following two lines to set component requirements (see docs)",
+             "set(COMPONENT_REQUIRES \"\")",
+             "set(COMPONENT_PRIV_REQUIRES \"\")",
+             "",
+             sources_line,
+             "",
+             "register_component()"]
+    if cflags is not None:
+        lines += ["", "component_compile_options(%s)" % cflags]
+    lines.append("")
+
+    with open(cmakelists_path, "w", buffering=1 << 16) as f:
+        f.write("\n".join(lines))
+
+    with _print_lock:
+        print("Converted %s" % cmakelists_path)
+
+
+def main():
+    global debug
+
+    parser = argparse.ArgumentParser(description='convert_to_cmake.py - ESP-IDF Project Makefile to CMakeLists.txt converter')
+    parser.add_argument('--debug', help='Display debugging output', action='store_true')
+    parser.add_argument('project', help='Path to project to convert (defaults to CWD)',
+                        default=os.getcwd(), metavar='project path', nargs='?')
+
+    args = parser.parse_args()
+    debug = args.debug
+    print("Converting %s..." % args.project)
+    convert_project(os.path.abspath(args.project))
+
+
+if __name__ == "__main__":
+    main()